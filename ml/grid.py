@@ -0,0 +1,201 @@
+# ml/grid.py
+#
+# Packed water-cell representation of the GLSEA grid.
+#
+# Most of the GLSEA rectangle is land. A LakeGrid is built once from
+# the lake mask and stores fields as 1-D vectors holding only
+# the water cells (in row-major order). Index maps let us scatter back
+# to (y, x), look up 4-connected neighbours and group cells into the
+# coarse stride x stride blocks used by the polygon exporters.
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Tuple
+
+import numpy as np
+
+
+@dataclass(eq=False)
+class LakeGrid:
+    """
+    Packed index of the water cells on a 2-D (y, x) grid.
+
+    shape    : full grid shape (ny, nx)
+    rows     : row index of each water cell, size n
+    cols     : column index of each water cell, size n
+    index_2d : (ny, nx) int array, packed index of each cell or -1 on land
+    origin   : (row, col) offset of this grid inside the full domain;
+               non-zero when the grid covers a single tile
+    """
+
+    shape: Tuple[int, int]
+    rows: np.ndarray
+    cols: np.ndarray
+    index_2d: np.ndarray
+    origin: Tuple[int, int] = (0, 0)
+    _blocks: dict = field(default_factory=dict, repr=False)
+    _neighbours: np.ndarray | None = field(default=None, repr=False)
+
+    @classmethod
+    def from_mask(
+        cls, mask: np.ndarray, origin: Tuple[int, int] = (0, 0)
+    ) -> "LakeGrid":
+        """Build a LakeGrid from a boolean (y, x) water mask."""
+        mask = np.asarray(mask, dtype=bool)
+        if mask.ndim != 2:
+            raise ValueError("LakeGrid expects a 2-D (y, x) mask")
+
+        rows, cols = np.nonzero(mask)
+        index_2d = np.full(mask.shape, -1, dtype=np.int64)
+        index_2d[rows, cols] = np.arange(rows.size, dtype=np.int64)
+
+        return cls(
+            shape=(int(mask.shape[0]), int(mask.shape[1])),
+            rows=rows,
+            cols=cols,
+            index_2d=index_2d,
+            origin=(int(origin[0]), int(origin[1])),
+        )
+
+    @classmethod
+    def from_field(
+        cls, field2d: np.ndarray, origin: Tuple[int, int] = (0, 0)
+    ) -> "LakeGrid":
+        """Build a LakeGrid treating every finite cell of `field2d` as water."""
+        return cls.from_mask(np.isfinite(field2d), origin=origin)
+
+    @classmethod
+    def from_series(
+        cls,
+        arr: np.ndarray,
+        origin: Tuple[int, int] = (0, 0),
+        require_all: bool = True,
+    ) -> "LakeGrid":
+        """
+        Build a LakeGrid from a (t, y, x) array, keeping only cells that
+        are finite at every time step (the static lake mask), or at any
+        time step when `require_all` is False.
+        """
+        arr = np.asarray(arr)
+        if arr.ndim != 3:
+            raise ValueError("LakeGrid.from_series expects a (t, y, x) array")
+        finite = np.isfinite(arr)
+        mask = finite.all(axis=0) if require_all else finite.any(axis=0)
+        return cls.from_mask(mask, origin=origin)
+
+    # -----------------------------------------------------------------
+    # Basic properties
+    # -----------------------------------------------------------------
+
+    @property
+    def size(self) -> int:
+        """Number of water cells."""
+        return int(self.rows.size)
+
+    @property
+    def mask(self) -> np.ndarray:
+        """Boolean (y, x) water mask."""
+        return self.index_2d >= 0
+
+    @property
+    def coverage(self) -> float:
+        """Fraction of the full rectangle that is water."""
+        ny, nx = self.shape
+        return self.size / float(ny * nx)
+
+    # -----------------------------------------------------------------
+    # Pack / unpack
+    # -----------------------------------------------------------------
+
+    def pack(self, arr: np.ndarray) -> np.ndarray:
+        """
+        Gather water cells from an array whose last two axes are (y, x).
+
+        (y, x) -> (n,) and (t, y, x) -> (t, n). The input dtype is kept.
+        """
+        arr = np.asarray(arr)
+        if arr.shape[-2:] != self.shape:
+            raise ValueError(
+                f"array spatial shape {arr.shape[-2:]} != grid shape {self.shape}"
+            )
+        return arr[..., self.rows, self.cols]
+
+    def unpack(self, vec: np.ndarray, fill: float = np.nan) -> np.ndarray:
+        """
+        Scatter packed values back to the full grid, filling land with `fill`.
+
+        (n,) -> (y, x) and (t, n) -> (t, y, x).
+        """
+        vec = np.asarray(vec)
+        if vec.shape[-1] != self.size:
+            raise ValueError(
+                f"packed length {vec.shape[-1]} != number of water cells {self.size}"
+            )
+        dtype = np.result_type(vec, fill)
+        out = np.full(vec.shape[:-1] + self.shape, fill, dtype=dtype)
+        out[..., self.rows, self.cols] = vec
+        return out
+
+    # -----------------------------------------------------------------
+    # Neighbours and block membership
+    # -----------------------------------------------------------------
+
+    @property
+    def neighbours(self) -> np.ndarray:
+        """
+        (n, 4) packed indices of the north, south, west and east neighbours
+        of each water cell; -1 where the neighbour is land or off-grid.
+        """
+        if self._neighbours is None:
+            padded = np.pad(self.index_2d, 1, constant_values=-1)
+            r = self.rows + 1
+            c = self.cols + 1
+            self._neighbours = np.stack(
+                [
+                    padded[r - 1, c],
+                    padded[r + 1, c],
+                    padded[r, c - 1],
+                    padded[r, c + 1],
+                ],
+                axis=1,
+            )
+        return self._neighbours
+
+    def blocks(self, stride: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Group water cells into stride x stride blocks.
+
+        Returns
+        -------
+        block_of_cell : (n,) index into the block arrays for each water cell
+        block_rows    : (m,) row of each non-empty block (in block units)
+        block_cols    : (m,) column of each non-empty block (in block units)
+
+        Blocks are laid out on the full domain, i.e. offset by `origin`,
+        so a tile whose origin is a multiple of `stride` yields the same
+        blocks as the untiled grid. Only blocks containing at least one
+        water cell are listed, in row-major order.
+        """
+        if stride < 1:
+            raise ValueError("stride must be >= 1")
+
+        if stride not in self._blocks:
+            r0, c0 = self.origin
+            nbx = -(-(c0 + self.shape[1]) // stride)
+            flat = ((self.rows + r0) // stride) * nbx + (self.cols + c0) // stride
+            uniq, block_of_cell = np.unique(flat, return_inverse=True)
+            self._blocks[stride] = (
+                block_of_cell.reshape(-1),
+                uniq // nbx,
+                uniq % nbx,
+            )
+        return self._blocks[stride]
+
+    def block_mean(self, vec: np.ndarray, stride: int) -> np.ndarray:
+        """Mean of a packed field over each non-empty stride x stride block."""
+        block_of_cell, block_rows, _ = self.blocks(stride)
+        m = block_rows.size
+        sums = np.bincount(block_of_cell, weights=vec, minlength=m)
+        counts = np.bincount(block_of_cell, minlength=m)
+        return sums / counts
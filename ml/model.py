@@ -7,14 +7,19 @@
 #    using the initial-condition pair (GLSEA + NIC ice).
 # 3) Convert forecast ice fields into GeoJSON polygons that the
 #    React map can render for multiple forecast times.
+#
+# All fitting and mapping runs on packed water-cell vectors (see
+# ml/grid.py); 2-D fields are only rebuilt at the xarray boundary.
 
 from dataclasses import dataclass
 import math
-from typing import Iterable, Sequence
+from typing import Iterable, Optional, Sequence
 
 import numpy as np
 import xarray as xr
 
+from .grid import LakeGrid
+
 
 # ---------------------------------------------------------------------
 # 1. Global AR(1) model for GLSEA temperatures
@@ -28,14 +33,19 @@ class AR1GLSEAModel:
 
         T_{t+1} = alpha * T_t + beta
 
-    learned from all grid cells and times in the training dataset.
+    learned from all water cells and times in the training dataset.
     """
 
     alpha: float
     beta: float
 
     @classmethod
-    def fit(cls, train_ds: xr.Dataset, var: str = "temp") -> "AR1GLSEAModel":
+    def fit(
+        cls,
+        train_ds: xr.Dataset,
+        var: str = "temp",
+        grid: Optional[LakeGrid] = None,
+    ) -> "AR1GLSEAModel":
         """
         Fit a single global AR(1) relationship using the variable `var`
         from the training dataset.
@@ -46,12 +56,20 @@ class AR1GLSEAModel:
             Training GLSEA dataset
         var : str
             Variable name for SST (default "temp")
+        grid : LakeGrid, optional
+            Water cells to fit on. Defaults to the cells that are finite
+            at any time step; pairs with a missing day are dropped.
         """
-        da = train_ds[var].astype("float32")  # (time, y, x) or (time, lat, lon)
+        arr = train_ds[var].astype("float32").values  # (time, y, x)
 
-        x = da.isel(time=slice(0, -1)).values.ravel()
-        y = da.isel(time=slice(1, None)).values.ravel()
+        if grid is None:
+            grid = LakeGrid.from_series(arr, require_all=False)
 
+        packed = grid.pack(arr)  # (time, n_water)
+        x = packed[:-1].ravel()
+        y = packed[1:].ravel()
+
+        # Cells with gaps keep their valid (t, t+1) pairs
         mask = np.isfinite(x) & np.isfinite(y)
         x = x[mask]
         y = y[mask]
@@ -76,7 +94,7 @@ class AR1GLSEAModel:
         return cls(alpha=float(alpha), beta=float(beta))
 
     def step(self, field: np.ndarray) -> np.ndarray:
-        """Advance a 2-D SST field by one time step."""
+        """Advance an SST field (2-D or packed) by one time step."""
         return self.alpha * field + self.beta
 
     def forecast_array(self, initial: np.ndarray, steps: int) -> np.ndarray:
@@ -85,12 +103,12 @@ class AR1GLSEAModel:
 
         Parameters
         ----------
-        initial : 2-D numpy array (lat, lon)
+        initial : numpy array, 2-D (lat, lon) or packed (n_water,)
         steps   : number of steps to forecast
 
         Returns
         -------
-        np.ndarray of shape (steps, lat, lon)
+        np.ndarray of shape (steps, *initial.shape)
         """
         current = initial.astype("float32")
         outs = []
@@ -125,6 +143,7 @@ class SstIceLookup:
         cover_da: xr.DataArray,
         thick_da: xr.DataArray,
         bin_width: float = 0.25,
+        grid: Optional[LakeGrid] = None,
     ) -> "SstIceLookup":
         """
         Build a 1-D lookup from SST to mean ice cover and thickness.
@@ -139,16 +158,20 @@ class SstIceLookup:
             NIC ice thickness (cm) at t0
         bin_width : float
             SST bin width in degrees C
+        grid : LakeGrid, optional
+            Cells to train on. Defaults to cells where all three fields
+            are finite.
         """
         sst = sst_da.values
         cover = cover_da.values
         thick = thick_da.values
 
-        mask = np.isfinite(sst) & np.isfinite(cover) & np.isfinite(thick)
+        if grid is None:
+            grid = LakeGrid.from_series(np.stack([sst, cover, thick]))
 
-        sst_flat = sst[mask]
-        cover_flat = cover[mask]
-        thick_flat = thick[mask]
+        sst_flat = grid.pack(sst)
+        cover_flat = grid.pack(cover)
+        thick_flat = grid.pack(thick)
 
         if sst_flat.size == 0:
             raise ValueError("No valid training points for SST→ice mapping")
@@ -168,8 +191,8 @@ class SstIceLookup:
             sel = (sst_flat >= lo) & (sst_flat < hi)
 
             if np.any(sel):
-                cover_lut[i] = float(np.nanmean(cover_flat[sel]))
-                thick_lut[i] = float(np.nanmean(thick_flat[sel]))
+                cover_lut[i] = float(cover_flat[sel].mean())
+                thick_lut[i] = float(thick_flat[sel].mean())
                 prev = (cover_lut[i], thick_lut[i])
             else:
                 # If no data in this bin, carry forward last non-empty bin
@@ -199,26 +222,46 @@ class SstIceLookup:
 
         return t
 
-    def apply_to_da(self, sst_da: xr.DataArray):
+    def apply_packed(self, sst: np.ndarray):
+        """
+        Map a packed SST vector (water cells only) to packed
+        (ice_cover, ice_thickness, ice_type) vectors.
+        """
+        idx = np.digitize(sst, self.bin_edges) - 1
+        idx = np.clip(idx, 0, len(self.cover_lut) - 1)
+
+        cover_vals = self.cover_lut[idx]
+        thick_vals = self.thick_lut[idx]
+        type_vals = self._classify_from_thickness(thick_vals)
+
+        return cover_vals, thick_vals, type_vals
+
+    def apply_to_da(self, sst_da: xr.DataArray, grid: Optional[LakeGrid] = None):
         """
         Map a forecast SST field to (ice_cover, ice_thickness, ice_type)
         as xarray DataArrays on the same grid.
+
+        `sst_da` is (y, x) or (time, y, x). Only the water cells of `grid`
+        (default: cells with finite SST at any time) are mapped; land and
+        missing values come back as NaN.
         """
         sst = sst_da.values
-        flat = sst.ravel()
+        if grid is None:
+            if sst.ndim == 3:
+                grid = LakeGrid.from_series(sst, require_all=False)
+            else:
+                grid = LakeGrid.from_field(sst)
 
-        idx = np.digitize(flat, self.bin_edges) - 1
-        idx = np.clip(idx, 0, len(self.cover_lut) - 1)
+        packed = grid.pack(sst)  # (n,) or (time, n)
+        missing = ~np.isfinite(packed)
 
-        cover_vals = self.cover_lut[idx].reshape(sst.shape)
-        thick_vals = self.thick_lut[idx].reshape(sst.shape)
+        cover_vals, thick_vals, type_vals = self.apply_packed(packed)
+        for v in (cover_vals, thick_vals, type_vals):
+            v[missing] = np.nan
 
-        type_vals = self._classify_from_thickness(thick_vals)
-
-        mask = ~np.isfinite(sst)
-        cover_vals[mask] = np.nan
-        thick_vals[mask] = np.nan
-        type_vals[mask] = np.nan
+        cover_vals, thick_vals, type_vals = (
+            grid.unpack(v) for v in (cover_vals, thick_vals, type_vals)
+        )
 
         coords = sst_da.coords
         dims = sst_da.dims
@@ -285,6 +328,7 @@ def da_to_geojson(
     times: Sequence[str],
     stride: int = 1,
     land_threshold: float = -900.0,
+    grid: Optional[LakeGrid] = None,
 ) -> dict:
     """
     Convert a 3-D field (time, y, x) into polygons for *all* forecast times.
@@ -308,6 +352,9 @@ def da_to_geojson(
         Subsampling stride (1 = full resolution, 2 = every other cell, etc.)
     land_threshold : float
         Values ≤ this are treated as land/missing and dropped.
+    grid : LakeGrid, optional
+        Water cells to export. Defaults to the cells that are finite
+        at any time step.
     """
     if "time" not in da.dims:
         raise ValueError("da_to_geojson expects a DataArray with a 'time' dimension")
@@ -319,63 +366,77 @@ def da_to_geojson(
     # Get 2-D lat/lon for cell corners
     lat2d, lon2d = _lat_lon_2d(da.isel(time=0))
 
-    # Basic spatial shape
-    ny, nx = da.isel(time=0).shape
+    values = da.values  # (time, ny, nx)
+    ny, nx = values.shape[1:]
+
+    if grid is None:
+        grid = LakeGrid.from_series(values, require_all=False)
+
+    # Water cells on the stride lattice that have a full set of corners
+    rows, cols = grid.rows, grid.cols
+    keep = (
+        (rows % stride == 0)
+        & (cols % stride == 0)
+        & (rows < ny - 1)
+        & (cols < nx - 1)
+    )
+    rows = rows[keep]
+    cols = cols[keep]
+    packed = grid.pack(values)[:, keep]  # (time, n_kept)
 
     features = []
     fid = 0
 
     for t_idx, iso_time in enumerate(times):
-        frame = da.isel(time=t_idx).values  # (ny, nx)
-
-        for i in range(0, ny - 1, stride):
-            for j in range(0, nx - 1, stride):
-                val = float(frame[i, j])
-
-                # Skip obvious missing / land, but KEEP 0's (open water)
-                if not math.isfinite(val):
-                    continue
-                if val <= land_threshold:
-                    continue
-
-                # For ice_type, snap into discrete legend bins
-                if product == "ice_type":
-                    if val < 5:
-                        val = 0.0
-                    elif val < 25:
-                        val = 10.0
-                    elif val < 55:
-                        val = 40.0
-                    elif val < 85:
-                        val = 70.0
-                    else:
-                        val = 95.0
-
-                # Build polygon from cell "corners" using neighbouring grid points
-                poly = [
-                    [float(lon2d[i, j]),     float(lat2d[i, j])],
-                    [float(lon2d[i, j + 1]), float(lat2d[i, j + 1])],
-                    [float(lon2d[i + 1, j + 1]), float(lat2d[i + 1, j + 1])],
-                    [float(lon2d[i + 1, j]), float(lat2d[i + 1, j])],
-                    [float(lon2d[i, j]),     float(lat2d[i, j])],
-                ]
-
-                features.append(
-                    {
-                        "type": "Feature",
-                        "id": fid,
-                        "properties": {
-                            "time": iso_time,
-                            "value": val,
-                            "product": product,
-                            "step": t_idx,
-                        },
-                        "geometry": {
-                            "type": "Polygon",
-                            "coordinates": [poly],
-                        },
-                    }
-                )
-                fid += 1
+        frame = packed[t_idx]
+
+        for k in range(rows.size):
+            i = int(rows[k])
+            j = int(cols[k])
+            val = float(frame[k])
+
+            # Skip obvious missing / land, but KEEP 0's (open water)
+            if not math.isfinite(val) or val <= land_threshold:
+                continue
+
+            # For ice_type, snap into discrete legend bins
+            if product == "ice_type":
+                if val < 5:
+                    val = 0.0
+                elif val < 25:
+                    val = 10.0
+                elif val < 55:
+                    val = 40.0
+                elif val < 85:
+                    val = 70.0
+                else:
+                    val = 95.0
+
+            # Build polygon from cell "corners" using neighbouring grid points
+            poly = [
+                [float(lon2d[i, j]),     float(lat2d[i, j])],
+                [float(lon2d[i, j + 1]), float(lat2d[i, j + 1])],
+                [float(lon2d[i + 1, j + 1]), float(lat2d[i + 1, j + 1])],
+                [float(lon2d[i + 1, j]), float(lat2d[i + 1, j])],
+                [float(lon2d[i, j]),     float(lat2d[i, j])],
+            ]
+
+            features.append(
+                {
+                    "type": "Feature",
+                    "id": fid,
+                    "properties": {
+                        "time": iso_time,
+                        "value": val,
+                        "product": product,
+                        "step": t_idx,
+                    },
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [poly],
+                    },
+                }
+            )
+            fid += 1
 
     return {"type": "FeatureCollection", "features": features}
@@ -0,0 +1,88 @@
+# ml/tiling.py
+#
+# Tiled domain decomposition for grids too large to hold in memory.
+#
+# The (y, x) domain is split into rectangular tiles whose edges sit on
+# multiples of the export stride, so every coarse stride x stride block
+# belongs to exactly one tile. Tiles are processed independently in a
+# process pool and their results are stitched back in tile order.
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Tile:
+    """
+    One rectangular tile of the domain.
+
+    index : position of the tile in row-major tile order
+    rows  : slice of grid rows covered by the tile
+    cols  : slice of grid columns covered by the tile
+    """
+
+    index: int
+    rows: slice
+    cols: slice
+
+    @property
+    def origin(self) -> Tuple[int, int]:
+        """(row, col) of the tile's first cell in the full domain."""
+        return self.rows.start, self.cols.start
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.rows.stop - self.rows.start, self.cols.stop - self.cols.start
+
+
+def make_tiles(shape: Tuple[int, int], tile_size: int, stride: int = 1) -> List[Tile]:
+    """
+    Split a (ny, nx) domain into tiles of about `tile_size` cells a side.
+
+    `tile_size` is rounded up to a multiple of `stride` so that tile
+    edges coincide with export block edges: no block is split between
+    two tiles and none is left out.
+    """
+    if tile_size < 1 or stride < 1:
+        raise ValueError("tile_size and stride must be >= 1")
+
+    size = -(-tile_size // stride) * stride
+    ny, nx = shape
+
+    tiles = []
+    for r0 in range(0, ny, size):
+        for c0 in range(0, nx, size):
+            tiles.append(
+                Tile(
+                    index=len(tiles),
+                    rows=slice(r0, min(r0 + size, ny)),
+                    cols=slice(c0, min(c0 + size, nx)),
+                )
+            )
+    return tiles
+
+
+def map_tiles(
+    fn: Callable[..., T],
+    tiles: Sequence[Tile],
+    *args,
+    workers: Optional[int] = None,
+) -> List[T]:
+    """
+    Call `fn(tile, *args)` for every tile and return results in tile order.
+
+    With `workers` > 1 the calls run in a process pool; `fn` must then be
+    a module-level function and should load its own slice of the data
+    (e.g. from a file path) so each worker only holds one tile at a time.
+    """
+    if workers is None or workers <= 1:
+        return [fn(tile, *args) for tile in tiles]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fn, tile, *args) for tile in tiles]
+        return [f.result() for f in futures]
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import argparse
 import json
+import os
 from pathlib import Path
 
 import numpy as np
 import xarray as xr
 
+from .grid import LakeGrid
+from .tiling import Tile, make_tiles, map_tiles
+
 # --------------------------------------------------------------
 # Paths (run from project root with:  python -m ml.train_and_export)
 # --------------------------------------------------------------
@@ -25,10 +30,46 @@ FORECAST_TIMES = [
     "2025-02-13T00:00:00Z",
 ]
 
+# One knob to control resolution: smaller stride = finer grid, more polygons
+BASE_STRIDE = 5  # try 8 or 5 if you want even finer
+
+# Exported products, in sst_to_ice_fields order, with their min |value|
+PRODUCTS = [
+    ("ice_concentration", 1.0),   # at least 1% cover
+    ("ice_thickness", 0.01),      # at least 1 cm
+    ("ice_type", 5.0),            # ignore vanishing amounts
+]
+
 
 # --------------------------------------------------------------
 # 1. Fit global AR(1) model on GLSEA temps
 # --------------------------------------------------------------
+def ar1_stats(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """AR(1) sufficient statistics (n, Σx, Σy, Σx², Σxy) in float64."""
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    return np.array([x.size, x.sum(), y.sum(), (x * x).sum(), (x * y).sum()])
+
+
+def solve_ar1(stats: np.ndarray) -> tuple[float, float]:
+    """
+    Least-squares (alpha, beta) for T_{t+1} = alpha * T_t + beta from
+    summed ar1_stats. Shared by the untiled and tiled fits.
+    """
+    n, sx, sy, sxx, sxy = stats
+
+    if n < 2:
+        raise RuntimeError("Not enough valid points to fit AR(1)")
+
+    denom = n * sxx - sx * sx
+    if not denom > 1e-12 * n * sxx:
+        raise RuntimeError("Degenerate AR(1) fit: training temps have no variance")
+
+    alpha = (n * sxy - sx * sy) / denom
+    beta = (sy - alpha * sx) / n
+    return float(alpha), float(beta)
+
+
 def fit_ar1_from_glsea(glsea_path: Path) -> tuple[float, float]:
     print(f"Loading training GLSEA from {glsea_path}")
     ds = xr.open_dataset(glsea_path, decode_times=False)
@@ -40,40 +81,38 @@ def fit_ar1_from_glsea(glsea_path: Path) -> tuple[float, float]:
     # Treat crazy values as NaN
     arr = np.where(arr < -50.0, np.nan, arr)
 
-    t, ny, nx = arr.shape
-    x = arr[:-1].reshape((t - 1, ny * nx))
-    y = arr[1:].reshape((t - 1, ny * nx))
-
-    mask = np.isfinite(x) & np.isfinite(y)
-    x_valid = x[mask]
-    y_valid = y[mask]
+    # Lake cells: valid on at least one training day
+    grid = LakeGrid.from_series(arr, require_all=False)
+    packed = grid.pack(arr)  # (t, n_water)
+    print(f"  {grid.size} water cells ({grid.coverage:.3f} of training grid)")
 
-    if x_valid.size < 2:
-        raise RuntimeError("Not enough valid points to fit AR(1)")
+    x = packed[:-1].ravel()
+    y = packed[1:].ravel()
 
-    A = np.vstack([x_valid, np.ones_like(x_valid)]).T
-    alpha, beta = np.linalg.lstsq(A, y_valid, rcond=None)[0]
+    # Cells with gaps keep their valid (t, t+1) pairs
+    mask = np.isfinite(x) & np.isfinite(y)
 
     print("Fitting global AR(1) model (T_{t+1} = alpha * T_t + beta)...")
+    alpha, beta = solve_ar1(ar1_stats(x[mask], y[mask]))
     print(f"  alpha = {alpha:.4f}, beta = {beta:.4f}")
-    return float(alpha), float(beta)
+    return alpha, beta
 
 
 # --------------------------------------------------------------
 # 2. Forecast SST forward from the test initial condition
 # --------------------------------------------------------------
-def forecast_sst(alpha: float, beta: float, sst0: xr.DataArray, steps: int = 4):
+def forecast_sst(alpha: float, beta: float, sst0: np.ndarray, steps: int = 4):
     """
     alpha, beta: AR(1) coefficients
-    sst0: xr.DataArray 2D (lat, lon)
-    returns list[xr.DataArray] of length `steps`
+    sst0: packed SST vector (water cells only, see LakeGrid.pack)
+    returns np.ndarray of shape (steps, n_water)
     """
-    fields: list[xr.DataArray] = []
-    current = sst0.astype("float32").copy()
-    for _ in range(steps):
+    out = np.empty((steps,) + np.shape(sst0), dtype="float32")
+    current = np.asarray(sst0, dtype="float32")
+    for k in range(steps):
         current = alpha * current + beta
-        fields.append(current.copy(deep=True))
-    return fields
+        out[k] = current
+    return out
 
 
 # --------------------------------------------------------------
@@ -86,8 +125,9 @@ def sst_to_ice_fields(sst: np.ndarray, lake_mask: np.ndarray | None = None):
       - ice_thickness [m]
       - ice_type (0,10,40,70,95)
 
-    lake_mask: optional boolean mask of "water" cells;
-               outside the mask values are set to NaN.
+    sst is normally a packed water-cell vector, in which case no mask
+    is needed. For full 2-D fields, lake_mask is an optional boolean
+    mask of "water" cells; outside the mask values are set to NaN.
     """
     sst = np.array(sst, dtype="float32")
 
@@ -113,173 +153,254 @@ def sst_to_ice_fields(sst: np.ndarray, lake_mask: np.ndarray | None = None):
 
 
 # --------------------------------------------------------------
-# 4. Convert a 2D field to coarse polygons with a `time` property
-#    using only the GLSEA water mask
+# 4. Convert a packed field to coarse polygons with a `time` property
+#    using only the GLSEA water cells
 # --------------------------------------------------------------
 def field_to_polygons(
     field: np.ndarray,
+    grid: LakeGrid,
     lat_1d: np.ndarray,
     lon_1d: np.ndarray,
     time_str: str,
     stride: int = 12,
     min_abs: float = 0.01,
+    return_blocks: bool = False,
 ):
     """
-    Convert a 2D field (lat, lon) into coarse polygons.
+    Convert a packed field into coarse polygons.
 
-    field   : 2D numpy array [lat, lon] with NaNs outside lakes
-    lat_1d  : 1D lat array (size = field.shape[0])
-    lon_1d  : 1D lon array (size = field.shape[1])
+    field   : packed 1D numpy array of water-cell values (see LakeGrid.pack)
+    grid    : LakeGrid the field is packed on
+    lat_1d  : 1D lat array (size = grid.shape[0])
+    lon_1d  : 1D lon array (size = grid.shape[1])
     time_str: ISO timestamp string to store in properties.time
     stride  : native cells per coarse block (same both directions)
+
+    Only blocks holding at least one water cell are visited; each block
+    value is the mean over its water cells. `grid` may cover a single
+    tile of the lat/lon domain (see LakeGrid.origin).
+
+    With return_blocks=True, also returns the global (block row, block
+    col) of each feature, used to stitch tiles back into block order.
     """
-    ny, nx = field.shape
-    assert ny == lat_1d.size and nx == lon_1d.size
+    ny, nx = lat_1d.size, lon_1d.size
+    r0, c0 = grid.origin
+    assert r0 + grid.shape[0] <= ny and c0 + grid.shape[1] <= nx
 
     feats = []
+    keys = []
     fid = 0
 
     # Assume lat_1d and lon_1d are monotonic; treat them as centres.
     dlat = float(lat_1d[1] - lat_1d[0])
     dlon = float(lon_1d[1] - lon_1d[0])
 
-    for j0 in range(0, ny, stride):
-        j1 = min(j0 + stride, ny)
-        for i0 in range(0, nx, stride):
-            i1 = min(i0 + stride, nx)
-
-            block = field[j0:j1, i0:i1]
-            if not np.isfinite(block).any():
-                # Entire block is land / NaN
-                continue
-
-            v = float(np.nanmean(block))
-            if not np.isfinite(v) or abs(v) < min_abs:
-                continue
-
-            # Use outer cell centres ± 0.5 * step as approximate corners
-            lat_min = float(lat_1d[j0] - 0.5 * dlat)
-            lat_max = float(lat_1d[j1 - 1] + 0.5 * dlat)
-            lon_min = float(lon_1d[i0] - 0.5 * dlon)
-            lon_max = float(lon_1d[i1 - 1] + 0.5 * dlon)
-
-            coords = [[
-                [lon_min, lat_min],
-                [lon_max, lat_min],
-                [lon_max, lat_max],
-                [lon_min, lat_max],
-                [lon_min, lat_min],
-            ]]
-
-            feats.append({
-                "type": "Feature",
-                "id": fid,
-                "properties": {
-                    "time": time_str,
-                    "value": v,
-                },
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": coords,
-                },
-            })
-            fid += 1
+    means = grid.block_mean(field, stride)
+    _, block_rows, block_cols = grid.blocks(stride)
+
+    for v, by, bx in zip(means, block_rows, block_cols):
+        v = float(v)
+        if abs(v) < min_abs:
+            continue
 
+        j0 = int(by) * stride
+        i0 = int(bx) * stride
+        j1 = min(j0 + stride, ny)
+        i1 = min(i0 + stride, nx)
+
+        # Use outer cell centres ± 0.5 * step as approximate corners
+        lat_min = float(lat_1d[j0] - 0.5 * dlat)
+        lat_max = float(lat_1d[j1 - 1] + 0.5 * dlat)
+        lon_min = float(lon_1d[i0] - 0.5 * dlon)
+        lon_max = float(lon_1d[i1 - 1] + 0.5 * dlon)
+
+        coords = [[
+            [lon_min, lat_min],
+            [lon_max, lat_min],
+            [lon_max, lat_max],
+            [lon_min, lat_max],
+            [lon_min, lat_min],
+        ]]
+
+        feats.append({
+            "type": "Feature",
+            "id": fid,
+            "properties": {
+                "time": time_str,
+                "value": v,
+            },
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": coords,
+            },
+        })
+        keys.append((int(by), int(bx)))
+        fid += 1
+
+    if return_blocks:
+        return feats, keys
     return feats
 
 
+def step_features(
+    sst: np.ndarray,
+    grid: LakeGrid,
+    lat_1d: np.ndarray,
+    lon_1d: np.ndarray,
+    iso_time: str,
+    step_idx: int,
+    stride: int = BASE_STRIDE,
+    return_blocks: bool = False,
+):
+    """
+    Map one packed SST forecast step to ice fields and polygonize them.
+
+    Returns one feature list per entry of PRODUCTS, or one
+    (features, block keys) pair per product with return_blocks=True.
+    """
+    out = []
+    for (product, min_abs), fld in zip(PRODUCTS, sst_to_ice_fields(sst)):
+        res = field_to_polygons(
+            fld, grid, lat_1d, lon_1d,
+            time_str=iso_time,
+            stride=stride,
+            min_abs=min_abs,
+            return_blocks=return_blocks,
+        )
+        feats = res[0] if return_blocks else res
+        for f in feats:
+            f["properties"]["product"] = product
+            f["properties"]["step"] = step_idx
+        out.append(res)
+    return out
+
+
 # --------------------------------------------------------------
-# 5. Main: train, forecast 4 days, export multi-day GeoJSON
+# 5. Tiled execution for grids too large to hold in memory
 # --------------------------------------------------------------
-def main():
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
+def _fit_stats_tile(tile: Tile, glsea_path: Path) -> np.ndarray:
+    """AR(1) sufficient statistics (n, Σx, Σy, Σx², Σxy) over one tile."""
+    with xr.open_dataset(glsea_path, decode_times=False) as ds:
+        temp = ds["temp"]
+        arr = temp.isel(
+            {temp.dims[-2]: tile.rows, temp.dims[-1]: tile.cols}
+        ).values.astype("float32")
 
-    # 1) Fit AR(1) on training GLSEA
-    alpha, beta = fit_ar1_from_glsea(TRAIN_GLSEA)
+    arr = np.where(arr < -50.0, np.nan, arr)
+    grid = LakeGrid.from_series(arr, origin=tile.origin, require_all=False)
+    packed = grid.pack(arr)
 
-    # 2) Load test GLSEA initial condition (has lat, lon, sst)
-    print(f"Loading test GLSEA from {TEST_GLSEA}")
-    ds_init = xr.open_dataset(TEST_GLSEA, decode_times=False)
-    sst0 = ds_init["sst"].astype("float32")  # (lat, lon)
-    print(f"Initial SST range: {float(sst0.min())} → {float(sst0.max())}")
+    x = packed[:-1].ravel()
+    y = packed[1:].ravel()
 
-    lat_1d = ds_init["lat"].values
-    lon_1d = ds_init["lon"].values
+    mask = np.isfinite(x) & np.isfinite(y)
+    return ar1_stats(x[mask], y[mask])
 
-    # Lake mask straight from GLSEA: wherever SST is finite we call it water
-    lake_mask = np.isfinite(sst0.values)
-    coverage = lake_mask.mean()
-    print(f"GLSEA lake coverage fraction: {coverage:.3f}")
 
-    # 3) Forecast SST forward 4 steps
-    print("Forecasting SST forward 4 daily steps from initial test field...")
-    sst_forecasts = forecast_sst(alpha, beta, sst0, steps=len(FORECAST_TIMES))
+def fit_ar1_tiled(
+    glsea_path: Path, tile_size: int, workers: int | None = None
+) -> tuple[float, float]:
+    """
+    Same estimator as fit_ar1_from_glsea (solve_ar1), but each worker
+    reads one tile and returns its ar1_stats; the solve uses the totals.
+    """
+    print(f"Fitting AR(1) on {glsea_path} in tiles of {tile_size} cells")
+    with xr.open_dataset(glsea_path, decode_times=False) as ds:
+        shape = ds["temp"].shape[-2:]
 
-    all_cover_feats = []
-    all_thick_feats = []
-    all_type_feats = []
+    tiles = make_tiles(shape, tile_size)
+    stats = map_tiles(_fit_stats_tile, tiles, glsea_path, workers=workers)
+    alpha, beta = solve_ar1(np.sum(stats, axis=0))
 
-    # One knob to control resolution: smaller stride = finer grid, more polygons
-    BASE_STRIDE = 5  # try 8 or 5 if you want even finer
+    print(f"  alpha = {alpha:.4f}, beta = {beta:.4f}")
+    return alpha, beta
 
-    for step_idx, (sst_da, iso_time) in enumerate(zip(sst_forecasts, FORECAST_TIMES)):
-        print(f"  Step {step_idx}: {iso_time}")
-        ice_cover, ice_thickness, ice_type = sst_to_ice_fields(
-            sst_da.values, lake_mask=lake_mask
-        )
 
-        # ice_concentration
-        cover_feats = field_to_polygons(
-            ice_cover, lat_1d, lon_1d,
-            time_str=iso_time,
-            stride=BASE_STRIDE,
-            min_abs=1.0,   # at least 1% cover
+def _forecast_tile(
+    tile: Tile, test_path: Path, alpha: float, beta: float, stride: int
+):
+    """Forecast, ice mapping and polygon export for one tile."""
+    with xr.open_dataset(test_path, decode_times=False) as ds:
+        sst = ds["sst"]
+        lat_dim, lon_dim = sst.dims[-2], sst.dims[-1]
+        lat_1d = ds[lat_dim].values
+        lon_1d = ds[lon_dim].values
+        sst0 = sst.isel(
+            {lat_dim: tile.rows, lon_dim: tile.cols}
+        ).values.astype("float32")
+
+    grid = LakeGrid.from_field(sst0, origin=tile.origin)
+    sst_forecasts = forecast_sst(
+        alpha, beta, grid.pack(sst0), steps=len(FORECAST_TIMES)
+    )
+    return [
+        step_features(
+            sst, grid, lat_1d, lon_1d, iso_time, step_idx, stride,
+            return_blocks=True,
         )
-        for f in cover_feats:
-            f["properties"]["product"] = "ice_concentration"
-            f["properties"]["step"] = step_idx
-        all_cover_feats.extend(cover_feats)
+        for step_idx, (sst, iso_time) in enumerate(zip(sst_forecasts, FORECAST_TIMES))
+    ]
 
-        # ice_thickness
-        thick_feats = field_to_polygons(
-            ice_thickness, lat_1d, lon_1d,
-            time_str=iso_time,
-            stride=BASE_STRIDE,
-            min_abs=0.01,  # at least 1 cm
-        )
-        for f in thick_feats:
-            f["properties"]["product"] = "ice_thickness"
-            f["properties"]["step"] = step_idx
-        all_thick_feats.extend(thick_feats)
 
-        # ice_type
-        type_feats = field_to_polygons(
-            ice_type, lat_1d, lon_1d,
-            time_str=iso_time,
-            stride=BASE_STRIDE,
-            min_abs=5.0,   # ignore vanishing amounts
-        )
-        for f in type_feats:
-            f["properties"]["product"] = "ice_type"
-            f["properties"]["step"] = step_idx
-        all_type_feats.extend(type_feats)
+def stitch_tiles(tile_results):
+    """
+    Merge per-tile [step][product] (features, block keys) pairs into one
+    feature list per product, ordered by step then global block
+    (row, col) and renumbered per step, i.e. the same output as the
+    untiled run.
+
+    Tiles are aligned to the export stride, so each block appears in
+    exactly one tile and no de-duplication is needed.
+    """
+    merged = [[] for _ in PRODUCTS]
+    for step_idx in range(len(FORECAST_TIMES)):
+        for p_idx, feats in enumerate(merged):
+            pairs = [
+                (key, f)
+                for res in tile_results
+                for key, f in zip(res[step_idx][p_idx][1], res[step_idx][p_idx][0])
+            ]
+            pairs.sort(key=lambda kf: kf[0])
+            for fid, (_, f) in enumerate(pairs):
+                f["id"] = fid
+                feats.append(f)
+    return merged
+
+
+def run_tiled(
+    train_path: Path,
+    test_path: Path,
+    tile_size: int,
+    workers: int | None = None,
+    stride: int = BASE_STRIDE,
+):
+    """
+    Full pipeline in tiled mode. Peak memory per worker is bounded by
+    one tile; the parent process only holds the exported features.
+    """
+    alpha, beta = fit_ar1_tiled(train_path, tile_size, workers=workers)
+
+    with xr.open_dataset(test_path, decode_times=False) as ds:
+        shape = ds["sst"].shape
 
-    conc_fc = {"type": "FeatureCollection", "features": all_cover_feats}
-    thick_fc = {"type": "FeatureCollection", "features": all_thick_feats}
-    type_fc = {"type": "FeatureCollection", "features": all_type_feats}
+    tiles = make_tiles(shape, tile_size, stride=stride)
+    print(f"Forecasting {len(tiles)} tiles of the test grid {shape}...")
+    results = map_tiles(
+        _forecast_tile, tiles, test_path, alpha, beta, stride, workers=workers
+    )
+    return stitch_tiles(results)
 
-    conc_path = OUT_DIR / "ice_concentration.latest.geojson"
-    thick_path = OUT_DIR / "ice_thickness.latest.geojson"
-    type_path = OUT_DIR / "ice_type.latest.geojson"
 
+# --------------------------------------------------------------
+# 6. Main: train, forecast 4 days, export multi-day GeoJSON
+# --------------------------------------------------------------
+def write_outputs(product_feats) -> None:
+    """Write one FeatureCollection per product plus the frames file."""
     print(f"Exporting multi-day GeoJSON to {OUT_DIR} ...")
-    for path, fc in [
-        (conc_path, conc_fc),
-        (thick_path, thick_fc),
-        (type_path, type_fc),
-    ]:
+    for (product, _), feats in zip(PRODUCTS, product_feats):
+        path = OUT_DIR / f"{product}.latest.geojson"
         with path.open("w") as f:
-            json.dump(fc, f)
+            json.dump({"type": "FeatureCollection", "features": feats}, f)
         print("  ->", path)
 
     # Frames file for the React time slider
@@ -289,5 +410,64 @@ def main():
     print("Also wrote frames file:", frames_path)
 
 
+def main(tile_size: int | None = None, workers: int | None = None):
+    """
+    tile_size: if given, run in tiled mode with tiles of about this many
+               cells a side (rounded up to a multiple of BASE_STRIDE)
+    workers  : process-pool size for tiled mode (default: all cores)
+    """
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    if tile_size is not None:
+        product_feats = run_tiled(
+            TRAIN_GLSEA, TEST_GLSEA, tile_size,
+            workers=workers or os.cpu_count(),
+        )
+        write_outputs(product_feats)
+        return
+
+    # 1) Fit AR(1) on training GLSEA
+    alpha, beta = fit_ar1_from_glsea(TRAIN_GLSEA)
+
+    # 2) Load test GLSEA initial condition (has lat, lon, sst)
+    print(f"Loading test GLSEA from {TEST_GLSEA}")
+    ds_init = xr.open_dataset(TEST_GLSEA, decode_times=False)
+    sst0 = ds_init["sst"].astype("float32")  # (lat, lon)
+    print(f"Initial SST range: {float(sst0.min())} → {float(sst0.max())}")
+
+    lat_1d = ds_init["lat"].values
+    lon_1d = ds_init["lon"].values
+
+    # Lake mask straight from GLSEA: wherever SST is finite we call it water.
+    # Everything downstream runs on packed water-cell vectors.
+    grid = LakeGrid.from_field(sst0.values)
+    print(f"GLSEA lake coverage fraction: {grid.coverage:.3f}")
+
+    # 3) Forecast SST forward 4 steps
+    print("Forecasting SST forward 4 daily steps from initial test field...")
+    sst_forecasts = forecast_sst(
+        alpha, beta, grid.pack(sst0.values), steps=len(FORECAST_TIMES)
+    )
+
+    product_feats = [[] for _ in PRODUCTS]
+    for step_idx, (sst, iso_time) in enumerate(zip(sst_forecasts, FORECAST_TIMES)):
+        print(f"  Step {step_idx}: {iso_time}")
+        step_feats = step_features(sst, grid, lat_1d, lon_1d, iso_time, step_idx)
+        for all_feats, feats in zip(product_feats, step_feats):
+            all_feats.extend(feats)
+
+    write_outputs(product_feats)
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train AR(1) and export ice GeoJSON")
+    parser.add_argument(
+        "--tile-size", type=int, default=None,
+        help="run tiled with tiles of about this many cells a side",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="process-pool size for tiled mode (default: all cores)",
+    )
+    args = parser.parse_args()
+    main(tile_size=args.tile_size, workers=args.workers)
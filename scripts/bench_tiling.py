@@ -0,0 +1,98 @@
+# scripts/bench_tiling.py
+#
+# Throughput benchmark for the tiled pipeline (ml.train_and_export.run_tiled).
+#
+# Writes a synthetic high-resolution GLSEA-like training series and test
+# initial condition to a temp dir, then runs the full tiled pipeline
+# (fit, forecast, ice mapping, polygon export) with 1, 2, 4, ... workers
+# up to the number of cores and reports grid cells processed per second.
+#
+# Run from project root:
+#     python -m scripts.bench_tiling --ny 2000 --nx 3000 --tile-size 250
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from ml.train_and_export import BASE_STRIDE, run_tiled
+
+
+def make_synthetic(out_dir: Path, ny: int, nx: int, n_days: int, seed: int = 0):
+    """Write train/test NetCDF files with ~25% water cells."""
+    rng = np.random.default_rng(seed)
+
+    lat = np.linspace(41.0, 49.0, ny, dtype="float32")
+    lon = np.linspace(-92.5, -75.8, nx, dtype="float32")
+
+    # Smooth blobby lakes: threshold a low-frequency field
+    yy, xx = np.meshgrid(
+        np.linspace(0, 6 * np.pi, ny), np.linspace(0, 9 * np.pi, nx), indexing="ij"
+    )
+    lake_mask = (np.sin(yy) * np.cos(xx) + 0.3 * np.sin(0.5 * xx)) > 0.55
+
+    base = (2.0 * np.sin(yy / 3.0) - 0.5).astype("float32")
+    temp = np.empty((n_days, ny, nx), dtype="float32")
+    temp[0] = base
+    for t in range(1, n_days):
+        temp[t] = 0.95 * temp[t - 1] - 0.02 + 0.1 * rng.standard_normal((ny, nx))
+    temp[:, ~lake_mask] = np.nan
+
+    train_path = out_dir / "train.nc"
+    test_path = out_dir / "test.nc"
+
+    xr.Dataset({"temp": (("time", "y", "x"), temp)}).to_netcdf(train_path)
+    xr.Dataset(
+        {"sst": (("lat", "lon"), temp[-1])},
+        coords={"lat": lat, "lon": lon},
+    ).to_netcdf(test_path)
+
+    return train_path, test_path, float(lake_mask.mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tiled pipeline")
+    parser.add_argument("--ny", type=int, default=1500)
+    parser.add_argument("--nx", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=8)
+    parser.add_argument("--tile-size", type=int, default=250)
+    parser.add_argument("--stride", type=int, default=BASE_STRIDE)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        train_path, test_path, coverage = make_synthetic(
+            Path(tmp), args.ny, args.nx, args.days
+        )
+        n_cells = args.ny * args.nx
+        print(
+            f"Grid {args.ny} x {args.nx} ({coverage:.3f} water), "
+            f"tile {args.tile_size}, stride {args.stride}"
+        )
+
+        workers = 1
+        base_rate = None
+        while workers <= args.max_workers:
+            t0 = time.perf_counter()
+            feats = run_tiled(
+                train_path, test_path, args.tile_size,
+                workers=workers, stride=args.stride,
+            )
+            dt = time.perf_counter() - t0
+
+            rate = n_cells / dt
+            base_rate = base_rate or rate
+            n_feats = sum(len(f) for f in feats)
+            print(
+                f"workers={workers:3d}  {dt:7.2f} s  {rate / 1e6:7.2f} Mcells/s  "
+                f"speedup {rate / base_rate:5.2f}x  ({n_feats} features)"
+            )
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()